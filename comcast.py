@@ -1,12 +1,15 @@
 import asyncio
-import json
 import logging
 import os
-from typing import Dict, List, Optional
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import aiofiles
 import aiohttp
-from playwright.async_api import async_playwright, Page, Browser, Response
+import orjson
+from playwright.async_api import async_playwright, Page, Browser, Response, Route
 from dotenv import load_dotenv
-from utils import with_retry, get_proxy_config, get_aiohttp_proxy_url
+from utils import HTTPStatusError, with_retry, get_proxy_config, get_aiohttp_proxy_url
 
 # Load environment variables
 load_dotenv()
@@ -18,17 +21,55 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Directory where downloaded bill PDFs are saved
+BILLS_DIR = Path("bills")
+
+# Resource types the scraper never needs; blocking them speeds up page loads
+BLOCKED_RESOURCE_TYPES = {"image", "font", "media", "stylesheet"}
+
+# Number of accounts processed at once unless MAX_CONCURRENCY overrides it
+DEFAULT_MAX_CONCURRENCY = 5
+
+# How long a fetched user token is reused before requesting a new one
+USER_TOKEN_TTL = 25 * 60
+
 class ComcastScraper:
     def __init__(self):
         self.intercepted_requests: List[Dict] = []
         self.navigation_headers: Optional[Dict] = None
-        self.cookies: Optional[Dict] = None
+        self._base_headers: Dict[str, str] = {}
+        # User tokens keyed by customer_id -> (fetched_at, token)
+        self._token_cache: Dict[str, Tuple[float, str]] = {}
+        self._token_lock = asyncio.Lock()
         self.initial_navigation_response: Optional[str] = None
         self.navigation_response_future: Optional[asyncio.Future] = None
         self.page: Optional[Page] = None
         self.browser: Optional[Browser] = None
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.sema = asyncio.Semaphore(self.get_max_concurrency())
+        # The browser page is shared, so navigations must run one at a time
+        self.page_sema = asyncio.Semaphore(1)
+        self.dashboard_refresh_every = int(os.getenv('DASHBOARD_REFRESH_EVERY', '0'))
+        self.accounts_started = 0
         self.proxy_config = get_proxy_config()
 
+    @staticmethod
+    def get_max_concurrency() -> int:
+        """Get the number of accounts to process at once from MAX_CONCURRENCY."""
+        value = os.getenv('MAX_CONCURRENCY', str(DEFAULT_MAX_CONCURRENCY))
+        try:
+            max_concurrency = int(value)
+        except ValueError:
+            max_concurrency = 0
+
+        if max_concurrency < 1:
+            logger.error(
+                "Invalid MAX_CONCURRENCY %r, must be a positive integer. Using %d",
+                value, DEFAULT_MAX_CONCURRENCY
+            )
+            return DEFAULT_MAX_CONCURRENCY
+        return max_concurrency
+
     @staticmethod
     def get_credentials() -> tuple[str, str]:
         """Get credentials from environment variables."""
@@ -45,6 +86,7 @@ class ComcastScraper:
 
     async def setup(self):
         """Initialize browser and page with proper configuration."""
+        BILLS_DIR.mkdir(exist_ok=True)
         playwright = await async_playwright().start()
 
         # Configure browser with proxy if available
@@ -54,12 +96,14 @@ class ComcastScraper:
             if 'username' in self.proxy_config and 'password' in self.proxy_config:
                 browser_args.append(f'--proxy-auth={self.proxy_config["username"]}:{self.proxy_config["password"]}')
 
+        # Set HEADLESS=0 and SLOW_MO=<ms> to watch the browser while debugging
         self.browser = await playwright.chromium.launch(
-            headless=False,
-            slow_mo=500,
+            headless=os.getenv('HEADLESS', '1') == '1',
+            slow_mo=int(os.getenv('SLOW_MO', '0')),
             args=browser_args
         )
         self.page = await self.browser.new_page()
+        await self.page.route("**/*", self.block_static_resources)
 
         # Set up request and response listeners
         self.page.on("request", self.log_request)
@@ -68,6 +112,26 @@ class ComcastScraper:
         # Create future for navigation response
         self.navigation_response_future = asyncio.Future()
 
+        # Shared aiohttp session so all API calls reuse keep-alive connections
+        connector = aiohttp.TCPConnector(
+            limit=100,
+            limit_per_host=20,
+            ttl_dns_cache=300,
+            enable_cleanup_closed=True
+        )
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            json_serialize=lambda value: orjson.dumps(value).decode(),
+            timeout=aiohttp.ClientTimeout(total=60, connect=10)
+        )
+
+    async def block_static_resources(self, route: Route):
+        """Abort requests for resources that are not needed to capture the API traffic."""
+        if route.request.resource_type in BLOCKED_RESOURCE_TYPES:
+            await route.abort()
+        else:
+            await route.continue_()
+
     async def log_request(self, request):
         """Log and store navigation request details."""
         if request.url.endswith('/Navigation'):
@@ -79,13 +143,23 @@ class ComcastScraper:
                 "url": request.url,
                 "method": request.method,
                 "headers": request.headers,
-                "cookies": await self.page.context.cookies(),
                 "post_data": await request.post_data() if request.method == "POST" else None,
             }
             self.intercepted_requests.append(request_data)
-            logger.debug(f"Intercepted Navigation Request headers: {request_data.get('headers')}")
+            logger.debug("Intercepted Navigation Request headers: %s", request_data.get('headers'))
             self.navigation_headers = request.headers
-            self.cookies = {cookie['name']: cookie['value'] for cookie in request_data['cookies']}
+            self._build_base_headers()
+
+    def _build_base_headers(self):
+        """Build the headers shared by all API requests from the captured navigation headers."""
+        self._base_headers = {
+            'Content-Type': 'application/json',
+            'Origin': 'https://business.comcast.com',
+            'Sec-Fetch-Dest': 'empty',
+            'Sec-Fetch-Mode': 'cors',
+            'Sec-Fetch-Site': 'cross-site',
+            **(self.navigation_headers or {}),
+        }
 
     async def log_response(self, response: Response):
         """Log and store navigation response details."""
@@ -118,17 +192,20 @@ class ComcastScraper:
 
             # Fill username and click sign in
             await self.page.fill("input[name='user']", username)
-            await self.page.wait_for_timeout(2000)
             await self.page.click("#sign_in")
-            await self.page.wait_for_timeout(10000)
+            await self.page.wait_for_selector("input[name='passwd']", timeout=15000)
 
             # Fill password and click sign in
             await self.page.fill("input[name='passwd']", password)
             await self.page.click("#sign_in")
 
-            # Wait for navigation to complete
-            await self.page.wait_for_timeout(10000)
+            # Wait for the Navigation response captured by log_response
+            if self.navigation_response_future:
+                await asyncio.wait_for(self.navigation_response_future, timeout=30)
             logger.info("Login successful")
+        except asyncio.TimeoutError:
+            # Reported by run()
+            raise
         except Exception as e:
             logger.error(f"Login failed: {str(e)}")
             raise
@@ -142,95 +219,112 @@ class ComcastScraper:
             logger.warning(f"Skipping account with missing account_number or auth_guid")
             return
 
-        if not self.page:
-            logger.error("Page not initialized")
-            return
+        async with self.sema:
+            try:
+                # The API calls reuse the headers captured at login, so the dashboard is only
+                # revisited every DASHBOARD_REFRESH_EVERY accounts to keep the browser session alive
+                self.accounts_started += 1
+                if self.dashboard_refresh_every and self.accounts_started % self.dashboard_refresh_every == 0:
+                    if not self.page:
+                        logger.error("Page not initialized")
+                        return
+
+                    async with self.page_sema:
+                        await self.page.goto(f"https://business.comcast.com/account/dashboard/accounts/{auth_guid}")
+                        await self.page.wait_for_load_state("networkidle", timeout=15000)
+                    logger.info("Refreshed session via dashboard of account %s", account_number)
+
+                if not self.navigation_headers:
+                    logger.error("No navigation headers available while processing account")
+                    return
 
-        try:
-            # Navigate to account dashboard
-            await self.page.goto(f"https://business.comcast.com/account/dashboard/accounts/{auth_guid}")
-            await self.page.wait_for_timeout(10000)
-            logger.info(f"Successfully navigated to account {account_number}")
+                if not self.session:
+                    logger.error("HTTP session not initialized")
+                    return
 
-            if not self.navigation_headers:
-                logger.error("No navigation headers available while processing account")
-                return
+                try:
+                    await self.fetch_bill(self.session, customer_id, account_number)
+                except HTTPStatusError as e:
+                    if e.status != 401:
+                        raise
+                    # The rejected token was dropped from the cache, so this fetches a fresh one
+                    logger.warning("User token rejected for account %s, retrying with a new token", account_number)
+                    await self.fetch_bill(self.session, customer_id, account_number)
 
-            # Configure aiohttp session with proxy
-            proxy_url = get_aiohttp_proxy_url()
-            async with aiohttp.ClientSession() as session:
-                # Get user token
-                user_token = await self.get_user_token(session, customer_id, account_number)
-                if not user_token:
-                    return
+            except Exception as e:
+                logger.error(f"Error processing account {account_number}: {str(e)}")
 
-                # Get billing details
-                billing_response = await self.get_billing_details(session, account_number, user_token)
-                if not billing_response:
-                    return
+    async def fetch_bill(self, session: aiohttp.ClientSession, customer_id: str, account_number: str):
+        """Get a user token, then look up and download the account's latest bill."""
+        # Get user token
+        user_token = await self.get_user_token(session, customer_id)
 
-                # Download bill
-                await self.download_bill(session, account_number, billing_response, user_token)
+        # Get billing details
+        billing_response = await self.get_billing_details(session, account_number, user_token)
 
-        except Exception as e:
-            logger.error(f"Error processing account {account_number}: {str(e)}")
+        # Download bill
+        await self.download_bill(session, account_number, billing_response, user_token)
+
+    def _invalidate_user_token(self, user_token: str):
+        """Drop a rejected user token from the cache so the next lookup fetches a fresh one."""
+        for key in [key for key, (_, token) in self._token_cache.items() if token == user_token]:
+            del self._token_cache[key]
 
     @with_retry(max_retries=3)
-    async def get_user_token(self, session: aiohttp.ClientSession, customer_id: str, account_number: str) -> Optional[str]:
-        """Get user token for API requests."""
-        if not self.navigation_headers:
-            logger.error("No navigation headers available while getting user token")
-            return None
+    async def get_user_token(self, session: aiohttp.ClientSession, customer_id: str) -> str:
+        """Get user token for API requests.
 
-        headers = {
-            'Content-Type': 'application/json',
-            'Origin': 'https://business.comcast.com',
-            'Referer': 'https://business.comcast.com/account/bill',
-            'Sec-Fetch-Dest': 'empty',
-            'Sec-Fetch-Mode': 'cors',
-            'Sec-Fetch-Site': 'cross-site',
-            'Cb-Authorization': '',
-        }
-        headers.update(self.navigation_headers)
+        The token only depends on the customer, so it is fetched once and shared by all accounts.
+        """
+        if not self.navigation_headers:
+            raise Exception("No navigation headers available while getting user token")
+
+        # Serialize lookups so concurrent accounts wait for one fetch instead of each issuing their own
+        async with self._token_lock:
+            cached = self._token_cache.get(customer_id)
+            if cached and time.monotonic() - cached[0] < USER_TOKEN_TTL:
+                return cached[1]
+
+            headers = {
+                'Referer': 'https://business.comcast.com/account/bill',
+                'Cb-Authorization': '',
+                **self._base_headers,
+            }
 
-        proxy_url = get_aiohttp_proxy_url()
-        async with session.post(
-            'https://business-self-service-prod.codebig2.net/business-bootstrap-api/v1/api/state/application/orionInitialState',
-            headers=headers,
-            json={
-                "customerId": customer_id,
-                "userContextId": self.navigation_headers.get('tracking-id'),
-            },
-            proxy=proxy_url
-        ) as response:
-            if response.status != 200:
-                raise Exception(f"Failed to get user token. Status: {response.status}")
+            proxy_url = get_aiohttp_proxy_url()
+            async with session.post(
+                'https://business-self-service-prod.codebig2.net/business-bootstrap-api/v1/api/state/application/orionInitialState',
+                headers=headers,
+                json={
+                    "customerId": customer_id,
+                    "userContextId": self.navigation_headers.get('tracking-id'),
+                },
+                proxy=proxy_url
+            ) as response:
+                if response.status != 200:
+                    raise HTTPStatusError(f"Failed to get user token. Status: {response.status}", response.status)
+
+                authorization_response = orjson.loads(await response.read())
+                user_token = authorization_response.get('initialStateModel', {}).get('userToken')
+                if not user_token:
+                    raise Exception("No user token found in response")
 
-            authorization_response = await response.json()
-            user_token = authorization_response.get('initialStateModel', {}).get('userToken')
-            if not user_token:
-                raise Exception("No user token found in response")
+                self._token_cache[customer_id] = (time.monotonic(), user_token)
 
-            logger.info(f"User token for account {account_number}: {user_token}")
-            return user_token
+                logger.info("Fetched user token for customer %s", customer_id)
+                return user_token
 
     @with_retry(max_retries=3)
-    async def get_billing_details(self, session: aiohttp.ClientSession, account_number: str, user_token: str) -> Optional[Dict]:
+    async def get_billing_details(self, session: aiohttp.ClientSession, account_number: str, user_token: str) -> Dict:
         """Get billing details with retries."""
         if not self.navigation_headers:
-            logger.error("No navigation headers available while getting billing details")
-            return None
+            raise Exception("No navigation headers available while getting billing details")
 
         headers = {
-            'Content-Type': 'application/json',
-            'Origin': 'https://business.comcast.com',
             'Referer': 'https://business.comcast.com/account/bill',
-            'Sec-Fetch-Dest': 'empty',
-            'Sec-Fetch-Mode': 'cors',
-            'Sec-Fetch-Site': 'cross-site',
             'Cb-Authorization': user_token,
+            **self._base_headers,
         }
-        headers.update(self.navigation_headers)
 
         proxy_url = get_aiohttp_proxy_url()
         async with session.post(
@@ -244,33 +338,35 @@ class ComcastScraper:
             proxy=proxy_url
         ) as response:
             if response.status != 200:
-                raise Exception(f"Failed to get billing details. Status: {response.status}")
+                if response.status == 401:
+                    self._invalidate_user_token(user_token)
+                raise HTTPStatusError(f"Failed to get billing details. Status: {response.status}", response.status)
 
-            billing_response = await response.json()
-            logger.debug(f"Billing API Response for account {account_number}: {billing_response}")
+            billing_response = orjson.loads(await response.read())
+            logger.debug("Billing API Response for account %s: %s", account_number, billing_response)
             return billing_response
 
     @with_retry(max_retries=3)
     async def download_bill(self, session: aiohttp.ClientSession, account_number: str, billing_response: Dict, user_token: str):
         """Download bill PDF."""
         if not self.navigation_headers:
-            logger.error("No navigation headers available while downloading bill")
-            return
+            raise Exception("No navigation headers available while downloading bill")
 
         bill_id = billing_response.get('summary', {}).get('billId')
         if not bill_id:
             raise Exception(f"No billId found in response for account {account_number}")
 
+        pdf_filename = f"bill_{account_number}_{bill_id}.pdf"
+        pdf_path = BILLS_DIR / pdf_filename
+        if pdf_path.exists() and pdf_path.stat().st_size > 0:
+            logger.info("Bill %s already downloaded, skipping", pdf_filename)
+            return
+
         headers = {
-            'Content-Type': 'application/json',
-            'Origin': 'https://business.comcast.com',
             'Referer': 'https://business.comcast.com/',
-            'Sec-Fetch-Dest': 'empty',
-            'Sec-Fetch-Mode': 'cors',
-            'Sec-Fetch-Site': 'cross-site',
             'Cb-Authorization': user_token,
+            **self._base_headers,
         }
-        headers.update(self.navigation_headers)
 
         proxy_url = get_aiohttp_proxy_url()
         async with session.post(
@@ -285,13 +381,21 @@ class ComcastScraper:
             proxy=proxy_url
         ) as download_response:
             if download_response.status != 200:
-                raise Exception(f"Failed to download bill. Status: {download_response.status}")
+                if download_response.status == 401:
+                    self._invalidate_user_token(user_token)
+                raise HTTPStatusError(f"Failed to download bill. Status: {download_response.status}", download_response.status)
 
-            pdf_content = await download_response.read()
-            pdf_filename = f"bill_{account_number}_{bill_id}.pdf"
-            with open(f"bills/{pdf_filename}", "wb") as f:
-                f.write(pdf_content)
-            logger.info(f"Saved bill PDF to {pdf_filename}")
+            # Stream to a temporary file so an interrupted download isn't mistaken for a complete bill
+            part_path = pdf_path.with_name(f"{pdf_filename}.part")
+            try:
+                async with aiofiles.open(part_path, "wb") as f:
+                    async for chunk in download_response.content.iter_chunked(64 * 1024):
+                        await f.write(chunk)
+            except BaseException:
+                part_path.unlink(missing_ok=True)
+                raise
+            part_path.replace(pdf_path)
+            logger.info("Saved bill PDF to %s", pdf_filename)
 
     async def run(self):
         """Main execution flow."""
@@ -304,16 +408,20 @@ class ComcastScraper:
                 return
 
             await self.setup()
-            await self.login(username, password)
+            try:
+                await self.login(username, password)
+            except asyncio.TimeoutError:
+                logger.error("Timeout waiting for navigation response")
+                return
 
-            # Wait for navigation response
+            # Navigation response was already awaited during login
             try:
                 if not self.navigation_response_future:
                     logger.error("Navigation response future not initialized")
                     return
 
-                navigation_response = await asyncio.wait_for(self.navigation_response_future, timeout=30)
-                accounts_data = json.loads(navigation_response)
+                navigation_response = self.navigation_response_future.result()
+                accounts_data = orjson.loads(navigation_response)
                 customer_id = accounts_data.get('custGuid')
                 accounts = accounts_data.get('accounts', [])
 
@@ -321,15 +429,17 @@ class ComcastScraper:
                     logger.error("No accounts found in the navigation response")
                     return
 
-                for account in accounts:
-                    await self.process_account(account, customer_id)
+                await asyncio.gather(
+                    *(self.process_account(account, customer_id) for account in accounts),
+                    return_exceptions=True
+                )
 
-            except asyncio.TimeoutError:
-                logger.error("Timeout waiting for navigation response")
             except Exception as e:
                 logger.error(f"Error processing navigation response: {str(e)}")
 
         finally:
+            if self.session:
+                await self.session.close()
             if self.browser:
                 await self.browser.close()
 
@@ -338,4 +448,10 @@ async def main():
     await scraper.run()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    # Use uvloop's faster event loop when available
+    try:
+        import uvloop
+    except ImportError:
+        asyncio.run(main())
+    else:
+        uvloop.run(main())
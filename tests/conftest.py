@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Make the top-level modules importable when running pytest from the repository root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -0,0 +1,165 @@
+import asyncio
+import time
+
+import aiohttp
+import orjson
+import pytest
+
+import comcast
+import utils
+from comcast import ComcastScraper, DEFAULT_MAX_CONCURRENCY
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('3', 3),
+    ('0', DEFAULT_MAX_CONCURRENCY),
+    ('-2', DEFAULT_MAX_CONCURRENCY),
+    ('many', DEFAULT_MAX_CONCURRENCY),
+])
+def test_max_concurrency_falls_back_to_default_when_invalid(monkeypatch, value, expected):
+    monkeypatch.setenv('MAX_CONCURRENCY', value)
+    assert ComcastScraper.get_max_concurrency() == expected
+
+
+class StubResponse:
+    def __init__(self, status: int, body: bytes = b''):
+        self.status = status
+        self.body = body
+        self.content = self
+
+    async def read(self):
+        return self.body
+
+    async def iter_chunked(self, size):
+        yield self.body
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+class StubSession:
+    """Fake aiohttp session for the three billing API endpoints."""
+
+    def __init__(self, rejected_tokens=()):
+        self.rejected_tokens = set(rejected_tokens)
+        self.token_fetches = 0
+        self.calls = []
+
+    def post(self, url, headers, json, proxy=None):
+        endpoint = url.rsplit('/', 1)[-1]
+        token = headers.get('Cb-Authorization')
+        self.calls.append((endpoint, token))
+
+        if endpoint == 'orionInitialState':
+            self.token_fetches += 1
+            return self._token_response()
+        if token in self.rejected_tokens:
+            return StubResponse(401)
+        if endpoint == 'getDetails':
+            body = {'summary': {'billId': f"bill-{json['billingArrangementId']}"}}
+            return StubResponse(200, orjson.dumps(body))
+        return StubResponse(200, b'%PDF-stub')
+
+    def _token_response(self):
+        session = self
+
+        class TokenResponse(StubResponse):
+            async def read(self):
+                # Yield so concurrent callers get a chance to race for the token
+                await asyncio.sleep(0)
+                return orjson.dumps({'initialStateModel': {'userToken': f'token-{session.token_fetches}'}})
+
+        return TokenResponse(200)
+
+
+@pytest.fixture
+def scraper(monkeypatch, tmp_path):
+    monkeypatch.setattr(comcast, 'BILLS_DIR', tmp_path)
+    scraper = ComcastScraper()
+    scraper.navigation_headers = {'tracking-id': 'tracking'}
+    scraper._build_base_headers()
+    return scraper
+
+
+def accounts(count: int):
+    return [{'accountNumber': f'acct{i}', 'authGuid': f'guid{i}'} for i in range(count)]
+
+
+async def process_all(scraper, customer_id='customer'):
+    await asyncio.gather(*(scraper.process_account(account, customer_id) for account in accounts(4)))
+
+
+def test_concurrent_accounts_share_one_token_fetch(scraper, tmp_path):
+    scraper.session = StubSession()
+
+    asyncio.run(process_all(scraper))
+
+    assert scraper.session.token_fetches == 1
+    assert sorted(path.name for path in tmp_path.iterdir()) == [f'bill_acct{i}_bill-acct{i}.pdf' for i in range(4)]
+
+
+def test_rejected_token_is_refetched_and_account_retried_once(scraper, tmp_path):
+    scraper.session = StubSession(rejected_tokens={'stale'})
+    scraper._token_cache = {
+        'customer': (time.monotonic(), 'stale'),
+        'other-customer': (time.monotonic(), 'other'),
+    }
+
+    asyncio.run(scraper.process_account(accounts(1)[0], 'customer'))
+
+    assert scraper.session.calls == [
+        ('getDetails', 'stale'),
+        ('orionInitialState', ''),
+        ('getDetails', 'token-1'),
+        ('download', 'token-1'),
+    ]
+    assert scraper._token_cache['customer'][1] == 'token-1'
+    assert scraper._token_cache['other-customer'][1] == 'other'
+    assert (tmp_path / 'bill_acct0_bill-acct0.pdf').read_bytes() == b'%PDF-stub'
+
+
+def test_account_is_not_retried_twice_when_new_token_is_rejected(scraper, tmp_path):
+    scraper.session = StubSession(rejected_tokens={'stale', 'token-1'})
+    scraper._token_cache = {'customer': (time.monotonic(), 'stale')}
+
+    asyncio.run(scraper.process_account(accounts(1)[0], 'customer'))
+
+    assert [endpoint for endpoint, _ in scraper.session.calls] == ['getDetails', 'orionInitialState', 'getDetails']
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_expired_token_is_refetched(scraper):
+    scraper.session = StubSession()
+    scraper._token_cache = {'customer': (time.monotonic() - comcast.USER_TOKEN_TTL - 1, 'expired')}
+
+    token = asyncio.run(scraper.get_user_token(scraper.session, 'customer'))
+
+    assert token == 'token-1'
+    assert scraper.session.token_fetches == 1
+
+
+def test_partial_download_is_removed_on_failure(scraper, tmp_path, monkeypatch):
+    async def no_sleep(seconds):
+        pass
+
+    monkeypatch.setattr(utils.asyncio, 'sleep', no_sleep)
+
+    class BrokenStream(StubResponse):
+        async def iter_chunked(self, size):
+            yield b'%PDF-partial'
+            raise aiohttp.ClientPayloadError("connection lost")
+
+    class BrokenDownloadSession(StubSession):
+        def post(self, url, headers, json, proxy=None):
+            if url.endswith('/download'):
+                return BrokenStream(200)
+            return super().post(url, headers, json, proxy)
+
+    scraper.session = BrokenDownloadSession()
+
+    asyncio.run(scraper.process_account(accounts(1)[0], 'customer'))
+
+    assert list(tmp_path.iterdir()) == []
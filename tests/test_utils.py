@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+import utils
+from utils import HTTPStatusError, MAX_RETRY_DELAY, with_retry
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Record retry delays instead of actually sleeping."""
+    recorded = []
+
+    async def fake_sleep(seconds):
+        recorded.append(seconds)
+
+    monkeypatch.setattr(utils.asyncio, 'sleep', fake_sleep)
+    return recorded
+
+
+def make_failing(error: Exception, calls: list):
+    async def func():
+        calls.append(1)
+        raise error
+    return func
+
+
+@pytest.mark.parametrize('status', [429, 500, 503])
+def test_transient_status_is_retried_then_raised(sleeps, status):
+    calls = []
+    func = with_retry(max_retries=3)(make_failing(HTTPStatusError(f"HTTP {status}", status), calls))
+
+    with pytest.raises(HTTPStatusError) as exc_info:
+        asyncio.run(func())
+
+    assert exc_info.value.status == status
+    assert len(calls) == 3
+    assert len(sleeps) == 2
+
+
+@pytest.mark.parametrize('error', [HTTPStatusError("HTTP 401", 401), ValueError("bad value")])
+def test_non_retryable_error_is_raised_immediately(sleeps, error):
+    calls = []
+    func = with_retry(max_retries=3)(make_failing(error, calls))
+
+    with pytest.raises(type(error)):
+        asyncio.run(func())
+
+    assert len(calls) == 1
+    assert sleeps == []
+
+
+def test_result_is_returned_after_transient_failure(sleeps):
+    calls = []
+
+    async def func():
+        calls.append(1)
+        if len(calls) == 1:
+            raise HTTPStatusError("HTTP 503", 503)
+        return 'ok'
+
+    assert asyncio.run(with_retry(max_retries=3)(func)()) == 'ok'
+    assert len(calls) == 2
+
+
+def test_backoff_is_capped(sleeps, monkeypatch):
+    # Always pick the upper bound of the jitter range
+    monkeypatch.setattr(utils.random, 'uniform', lambda low, high: high)
+    func = with_retry(max_retries=4, delay=5.0)(make_failing(HTTPStatusError("HTTP 503", 503), []))
+
+    with pytest.raises(HTTPStatusError):
+        asyncio.run(func())
+
+    assert sleeps == [15.0, MAX_RETRY_DELAY, MAX_RETRY_DELAY]
+
+
+
+def test_max_retries_must_be_positive():
+    with pytest.raises(ValueError):
+        with_retry(max_retries=0)
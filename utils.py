@@ -1,7 +1,8 @@
 import asyncio
 import logging
+import random
 from typing import Callable, TypeVar, Any, Union, Optional, Dict
-from functools import wraps
+from functools import lru_cache, wraps
 import aiohttp
 import os
 from dotenv import load_dotenv
@@ -15,6 +16,41 @@ logger = logging.getLogger(__name__)
 T = TypeVar('T')
 ResponseType = Union[T, aiohttp.ClientResponse]
 
+# Upper bound on the backoff between retries, in seconds
+MAX_RETRY_DELAY = 30.0
+
+class HTTPStatusError(Exception):
+    """Raised when an API request returns an unexpected HTTP status."""
+
+    def __init__(self, message: str, status: int):
+        super().__init__(message)
+        self.status = status
+
+def is_retryable(error: Exception) -> bool:
+    """Check whether an error is transient and worth retrying.
+
+    Args:
+        error (Exception): Exception raised by the wrapped call.
+
+    Returns:
+        bool: True for network errors, timeouts, HTTP 429 and HTTP 5xx.
+    """
+    if isinstance(error, HTTPStatusError):
+        return error.status == 429 or error.status >= 500
+    return isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError))
+
+@lru_cache(maxsize=1)
+def _read_proxy_settings() -> Optional[tuple]:
+    """Read proxy settings from environment variables once.
+
+    Returns:
+        Optional[tuple]: (server, username, password) or None if no proxy is set.
+    """
+    proxy_server = os.getenv('PROXY_SERVER')
+    if not proxy_server:
+        return None
+    return proxy_server, os.getenv('PROXY_USERNAME'), os.getenv('PROXY_PASSWORD')
+
 def get_proxy_config() -> Optional[Dict[str, str]]:
     """Get proxy configuration from environment variables.
 
@@ -26,15 +62,14 @@ def get_proxy_config() -> Optional[Dict[str, str]]:
             'password': 'proxy_password'   # Optional
         }
     """
-    proxy_server = os.getenv('PROXY_SERVER')
-    if not proxy_server:
+    settings = _read_proxy_settings()
+    if not settings:
         return None
 
+    proxy_server, proxy_username, proxy_password = settings
     config = {'server': proxy_server}
 
     # Add authentication if provided
-    proxy_username = os.getenv('PROXY_USERNAME')
-    proxy_password = os.getenv('PROXY_PASSWORD')
     if proxy_username and proxy_password:
         config.update({
             'username': proxy_username,
@@ -43,6 +78,7 @@ def get_proxy_config() -> Optional[Dict[str, str]]:
 
     return config
 
+@lru_cache(maxsize=1)
 def get_aiohttp_proxy_url() -> Optional[str]:
     """Get proxy URL for aiohttp client.
 
@@ -58,18 +94,24 @@ def get_aiohttp_proxy_url() -> Optional[str]:
     return config['server']
 
 def with_retry(max_retries: int = 3, delay: float = 1.0):
-    """Decorator to retry async functions on failure.
+    """Decorator to retry async functions on transient failures.
+
+    Retries use exponential backoff with jitter, capped at MAX_RETRY_DELAY.
+    The last error is re-raised once retries are exhausted or it is not retryable.
 
     Args:
         max_retries (int): Maximum number of retry attempts. Defaults to 3.
-        delay (float): Delay between retries in seconds. Defaults to 1.0.
+        delay (float): Base delay between retries in seconds. Defaults to 1.0.
 
     Returns:
         Callable: Decorated function with retry capability.
     """
+    if max_retries < 1:
+        raise ValueError("max_retries must be at least 1")
+
     def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
         @wraps(func)
-        async def wrapper(*args, **kwargs) -> Optional[ResponseType]:
+        async def wrapper(*args, **kwargs) -> ResponseType:
             for attempt in range(max_retries):
                 try:
                     result = await func(*args, **kwargs)
@@ -77,17 +119,20 @@ def with_retry(max_retries: int = 3, delay: float = 1.0):
                     # Check if result is an aiohttp.ClientResponse
                     if isinstance(result, aiohttp.ClientResponse):
                         if result.status != 200:
-                            raise Exception(f"HTTP {result.status}: {await result.text()}")
+                            raise HTTPStatusError(f"HTTP {result.status}: {await result.text()}", result.status)
                         return result
 
                     return result
                 except Exception as e:
+                    if not is_retryable(e):
+                        # Left to the caller to handle or report, e.g. a 401 that triggers a token refresh
+                        logger.debug("Not retrying %s: %s", func.__name__, e)
+                        raise
                     if attempt < max_retries - 1:
                         logger.warning(f"Attempt {attempt + 1}/{max_retries} failed: {str(e)}")
-                        await asyncio.sleep(delay)
+                        await asyncio.sleep(min(MAX_RETRY_DELAY, random.uniform(delay, delay * 3 * (2 ** attempt))))
                     else:
                         logger.error(f"All {max_retries} attempts failed: {str(e)}")
-                        return None
-            return None
+                        raise
         return wrapper
-    return decorator
\ No newline at end of file
+    return decorator